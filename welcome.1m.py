@@ -4,6 +4,7 @@
 # requires-python = ">=3.13"
 # dependencies = [
 #     "aiohttp",
+#     "pillow",
 #     "pycountry",
 #     "pydantic",
 #     "pydantic-extra-types",
@@ -18,26 +19,37 @@
 # <swiftbar.hideDisablePlugin>true</swiftbar.hideDisablePlugin>
 # <swiftbar.hideSwiftBar>true</swiftbar.hideSwiftBar>
 
-from contextlib import contextmanager
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager, contextmanager, nullcontext
 from enum import Enum
+import fcntl
+import functools
 import hashlib
+import io
+import json
+import math
 from pathlib import Path
 import shutil
-import subprocess
-import tempfile
-from typing import Any, cast
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Mapping, NamedTuple, cast
 import aiohttp
 import asyncio
 import base64
+import argparse
 import os
+import sys
+import threading
+import weakref
 from collections import OrderedDict, defaultdict
 from yarl import URL
 from aiohttp.cookiejar import CookieJar
-import pickle
-from pydantic import BaseModel, ConfigDict
-from pydantic_extra_types.country import CountryAlpha2
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
 import urllib.parse
 
+if TYPE_CHECKING:
+    from aiohttp import web
+    from PIL import Image
+
 
 MENUBAR_ICON_B64 = "iVBORw0KGgoAAAANSUhEUgAAACIAAAAiCAYAAAA6RwvCAAAABGdBTUEAALGPC/xhBQAAACBjSFJNAAB6JgAAgIQAAPoAAACA6AAAdTAAAOpgAAA6mAAAF3CculE8AAAAhGVYSWZNTQAqAAAACAAFARIAAwAAAAEAAQAAARoABQAAAAEAAABKARsABQAAAAEAAABSASgAAwAAAAEAAgAAh2kABAAAAAEAAABaAAAAAAAAAJAAAAABAAAAkAAAAAEAA6ABAAMAAAABAAEAAKACAAQAAAABAAAAIqADAAQAAAABAAAAIgAAAAAQQkDBAAAACXBIWXMAABYlAAAWJQFJUiTwAAABWWlUWHRYTUw6Y29tLmFkb2JlLnhtcAAAAAAAPHg6eG1wbWV0YSB4bWxuczp4PSJhZG9iZTpuczptZXRhLyIgeDp4bXB0az0iWE1QIENvcmUgNi4wLjAiPgogICA8cmRmOlJERiB4bWxuczpyZGY9Imh0dHA6Ly93d3cudzMub3JnLzE5OTkvMDIvMjItcmRmLXN5bnRheC1ucyMiPgogICAgICA8cmRmOkRlc2NyaXB0aW9uIHJkZjphYm91dD0iIgogICAgICAgICAgICB4bWxuczp0aWZmPSJodHRwOi8vbnMuYWRvYmUuY29tL3RpZmYvMS4wLyI+CiAgICAgICAgIDx0aWZmOk9yaWVudGF0aW9uPjE8L3RpZmY6T3JpZW50YXRpb24+CiAgICAgIDwvcmRmOkRlc2NyaXB0aW9uPgogICA8L3JkZjpSREY+CjwveDp4bXBtZXRhPgoZXuEHAAAFkklEQVRYCbWYy2vcVRTHf5PXZJJMHiYh5iFGo4kQCIRoMSZKQJTGR6hKjRVx48qNT1zUhdSuXLlzIYgu/Bd0UVBaXCmiBdsYpFGqRaUmwZi0ec+Mn++Ze8ZfHtNMOnjgzH2de873nnPuuT8miopTYp8ln6vRWmNj49GqqqqVioqKf5LJ5KNB3tb22XtTU2ZwcnIy2dTUdCca7ujt7b01bqi/v/9YZWVljrkCt7S0PBFkqkNbVmMg2tra0px2NpFIyNAq/Rz8pjT39fVN19XVGQDWN5kS5wSss7PzKclAZYMxIKOjoymM/YxCGdzC/bmurq7p4eHhhwmDg9gI6xpbv7q6OtfT0/MMY1HZYEwBQD5EmYxk4GsdHR0nU6mUg1jXWm1t7YWampoL6uMdm5MX8c40c6KywFTldUSf0MrwFiwwO0DgpV8GBgbSCqP6Yd3AhH7ZYBzIx0GhgAhEFrYQYHiORG5hbEQyN+PBSwwktxbasj3jQD4KCh2IgeB2zI6MjDSxJpKsyY+NjaUbGhpmGO8Aw/g5WHToMCXz+6JPaaV0G7abwannxsfH3RNxxQZmaGionmS+GPYVPMPYw1RynTFBku1EUCYg5ol0Ov2jTs1YJMOVcEVg9W8IBm89i4wofoD8zK5fByFXCoDYkg9PzExMTDQEeRm0ax7G3mjOwBC6Or9NzJlndLW7u7sPBGMo2SwXOghTUF9fvxuEvBAxf4Iidx4D33Gt5UGR1oqCUWGkHh0zySjaEyYDEe7+DhDUiRnFPWyUAQNBmMZV5Bgbq3YA5v4gtwMMxr3O2MFUgUn4J4NsAYyBQMkeTxCOi7tAaK/Jo/xd+gJxHV5Vn7nTtCKToS14Bq/9wFjyBkbA0f84Y1FenoI0JZcxIbbEVObvA0KbTDnAnw/yvk8e8fCYjIQh61P2U9hwMGYjVODHTAqDRzXBQGxXlLnzg4OD8cQ02diPKSdspwnPPPwXRk6Fda3tTmSTJzfqkPue9YIt9cm1RxIk5+Lm5uYtgNnK5XJ2HRXrtbW1bxBS/AQuTpLJ4Or7aO9B9q7t7e3cxsbGHAovLS8va59yxA9H18h0se/I1taWZLLYzGCzmhDNR5zqTyZ9k78nnnQyGicbY/yVmBd9rx69HGX/rbBBsnHPuC7p1h4VSduLvj8ivh8eBOVZXDbrC7T7AbHbgqG3Y7dFsRZ4cSHu6HqHscj25LtW/NR1IAI+h+0v29vbHwoylMjKypcY+Ol2A7HT4PpXXYY8+jv09RCK9cDN+zqnfIO+yD3hbQEIB3o9L5JHbO9KJpPx98XX9rTkwXFNEtNTnOSLICBvCEgEuHPUh5Pqk3f+pabhvpTNZr2GJJXNUiSSN4qRGeKteIEkHlhdXT3DaX4LwgX3A/QB1o7r1uH2nzicRGxvEcVuM2PXqohQfFobEktLS5dpL5Mn966srNxG3+a1Bme5AV2tra1HFhcXzzAWad6N2USRn0ThNEUE4tNSaK7kpCO4VWs6suY1YCob4bER+iLJlgLChA8DRBvMOnXgadudByIdYosDID03bBzkDmxKDY0r0t0n/In3aNfhKfhzWEanmpubP+Pqvk+uKCSHAnJYj6A/qlpfXz9L+5UG0Nfwt+oQlnMLCwtaO+wBdxQc6SqZuDV1EqatpUmpjyf8fSo5N7RPdDMesY18jyg0qinrgLFSTusAbGyCJf4UA+LzqoZys7PGViGpF1fJlYgH7yrv1RX1Afd7sKv9vifeatl1B9H/GgmKXoZ1IvEQfCCRnL0uxD8Dd3v/gFa63Y4/kNUOIr5XQh/Av8I3qgU5Cpy+zCxXeP6v09cnZbGwaF6fFLfDsqGxvz87sluLIrXjgTX+P0j1SED2gHbPvMiigOhlvQZrg05dLrsefa9Kr2y8BovM9r9oc+GsLZ6GZgAAAABJRU5ErkJggg=="
 
@@ -58,35 +70,230 @@ MENUBAR_NUMBER_ICONS_B64 = {
 
 SERVER_URL_PATH = Path(__file__).parent / ".welcome_server_url"
 try:
-    SERVER_URL = SERVER_URL_PATH.read_text().strip()
+    SERVER_URL = os.getenv("WELCOME_SERVER_URL") or SERVER_URL_PATH.read_text().strip()
 except FileNotFoundError:
     raise RuntimeError("Server URL not set. Create a file called '.welcome_server_url' in the same directory as this script with the URL as the only content.")
 
-WELCOME_DIR = Path.home() / ".welcome"
-COOKIE_PATH = WELCOME_DIR / "cookies"
+WELCOME_DIR = Path(os.getenv("WELCOME_DIR") or Path.home() / ".welcome")
+COOKIE_PATH = WELCOME_DIR / "cookies.json"
+LEGACY_COOKIE_PATH = WELCOME_DIR / "cookies"
 CACHE_DIR = WELCOME_DIR / "cache"
+API_CACHE_DIR = WELCOME_DIR / "api"
+TRACE_DIR = WELCOME_DIR / "traces"
+LAST_RENDER_PATH = WELCOME_DIR / "last_render"
+LOCK_DIR = WELCOME_DIR / "locks"
+FAILURES_PATH = WELCOME_DIR / "failures.json"
+
+AVATAR_SIZE = 20
+PEOPLE_AVATAR_SIZE = 26
+# Known people listed in full per room and per home, the rest going in an "N more…" submenu. 0 means no limit
+ROOM_PEOPLE_LIMIT = int(os.getenv("WELCOME_ROOM_PEOPLE_LIMIT", "15"))
+HOME_PEOPLE_LIMIT = int(os.getenv("WELCOME_HOME_PEOPLE_LIMIT", "40"))
+# Names listed in an overflow or unknown-people submenu before it's cut off. 0 means no limit
+PEOPLE_LIST_LIMIT = int(os.getenv("WELCOME_PEOPLE_LIST_LIMIT", "50"))
+AVATAR_CONCURRENCY = int(os.getenv("WELCOME_AVATAR_CONCURRENCY", "8"))
+REQUEST_CONCURRENCY = int(os.getenv("WELCOME_REQUEST_CONCURRENCY", "8"))
+# Render API responses from the last stored snapshot and refresh them in the background for the next run
+STALE_WHILE_REVALIDATE = os.getenv("WELCOME_STALE_WHILE_REVALIDATE") == "1"
+# Seconds between refreshes in `--stream` mode
+STREAM_INTERVAL = float(os.getenv("WELCOME_STREAM_INTERVAL", "60"))
+
+# Seconds a refresh may take before the menu is rendered with whatever has been fetched so far
+REFRESH_DEADLINE = float(os.getenv("WELCOME_DEADLINE", "45"))
+REQUEST_TIMEOUT = float(os.getenv("WELCOME_REQUEST_TIMEOUT", "10"))
+AVATAR_TIMEOUT = float(os.getenv("WELCOME_AVATAR_TIMEOUT", "5"))
+
+# Connection pools: one for the Welcome API, one shared by third-party avatar hosts so a slow CDN can't hold up API calls
+API_CONNECTION_LIMIT = int(os.getenv("WELCOME_API_CONNECTION_LIMIT", "10"))
+AVATAR_CONNECTION_LIMIT = int(os.getenv("WELCOME_AVATAR_CONNECTION_LIMIT", "16"))
+AVATAR_CONNECTION_LIMIT_PER_HOST = int(os.getenv("WELCOME_AVATAR_CONNECTION_LIMIT_PER_HOST", "6"))
+DNS_CACHE_TTL = int(os.getenv("WELCOME_DNS_CACHE_TTL", "300"))
+KEEPALIVE_TIMEOUT = float(os.getenv("WELCOME_KEEPALIVE_TIMEOUT", "30"))
+
+# Seconds before retrying a failed avatar URL, doubling with each failure in a row up to `MAX_BACKOFF`
+CLIENT_ERROR_BACKOFF = float(os.getenv("WELCOME_CLIENT_ERROR_BACKOFF", "3600"))
+SERVER_ERROR_BACKOFF = float(os.getenv("WELCOME_SERVER_ERROR_BACKOFF", "60"))
+MAX_BACKOFF = float(os.getenv("WELCOME_MAX_BACKOFF", "86400"))
+
+# Seconds a run waits for an overlapping one to finish (and reuses its menu) before refreshing anyway
+RUN_LOCK_TIMEOUT = float(os.getenv("WELCOME_RUN_LOCK_TIMEOUT", "60"))
+LOCK_POLL_INTERVAL = 0.05
+
+# Limits for downloaded and derived images in `CACHE_DIR`
+CACHE_MAX_BYTES = int(os.getenv("WELCOME_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_MAX_AGE = float(os.getenv("WELCOME_CACHE_MAX_AGE", str(7 * 24 * 60 * 60)))
+
+# Write a Chrome/Perfetto trace of each refresh to `TRACE_DIR`
+TRACE = os.getenv("WELCOME_TRACE") == "1"
+# Save every API and avatar response to this directory, for `--replay`. Bundles hold the API's data, but no cookies
+RECORD_DIR = os.getenv("WELCOME_RECORD")
+# Send every request to this stand-in instead, with the original URL in the query. Set by `--replay`
+REPLAY_URL = os.getenv("WELCOME_REPLAY")
+# Write a cProfile of the run to this file, for `pstats`
+PROFILE_PATH = os.getenv("WELCOME_PROFILE")
+
+# Median wall time of starting an interpreter and importing this script, checked by `--bench-startup`
+STARTUP_BUDGET_MS = 800
+
+
+class Tracer:
+    """Collects spans as Chrome trace events, viewable in Perfetto or `chrome://tracing`."""
 
+    def __init__(self):
+        self.events: list[dict[str, Any]] = []
+        self._start = time.perf_counter()
+        self._tids: dict[int, int] = {}
 
-xbar_nesting = 0
+    def _tid(self) -> int:
+        # Concurrent tasks each get their own track, since spans on one track have to nest
+        try:
+            ident = id(asyncio.current_task())
+        except RuntimeError:
+            ident = threading.get_ident()
 
-@contextmanager
-def xbar_submenu():
-    global xbar_nesting
+        return self._tids.setdefault(ident, len(self._tids) + 1)
 
-    xbar_nesting += 1
-    try:
-        yield
-    finally:
-        xbar_nesting -= 1
+    @contextmanager
+    def span(self, name: str, **args: Any):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.events.append({
+                "name": name,
+                "ph": "X",
+                "ts": (start - self._start) * 1_000_000,
+                "dur": (time.perf_counter() - start) * 1_000_000,
+                "pid": os.getpid(),
+                "tid": self._tid(),
+                "args": args,
+            })
+
+    def write(self) -> None:
+        if not self.events:
+            return
 
-def xbar_sep():
-    global xbar_nesting
+        path = TRACE_DIR / f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json"
+        write_atomic(path, json.dumps({"traceEvents": self.events, "displayTimeUnit": "ms"}).encode())
+
+        self.events.clear()
+
+tracer = Tracer() if TRACE else None
+no_span = nullcontext()
+
+def span(name: str, **args: Any):
+    if tracer is None:
+        return no_span
+
+    return tracer.span(name, **args)
+
+class Recorder:
+    """Collects the last response for each URL into a bundle for `--replay`: `bundle.json`, and bodies by hash."""
 
-    print("--" * xbar_nesting + "---", flush=True)
+    HEADERS = ("Content-Type", "ETag", "Last-Modified")
 
-def xbar(text: Any | None = None, copy: bool | str = False, image: bytes | None = None, **params: Any):
-    global xbar_nesting
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.responses: dict[str, dict[str, Any]] = {}
+        self._bodies: dict[str, bytes] = {}
+
+    def record(self, url: str, status: int, headers: Mapping[str, str], latency: float, body: bytes) -> None:
+        """`status` is 0 for connection errors and timeouts."""
+        body_hash = hashlib.sha256(body).hexdigest()
+        self._bodies[body_hash] = body
+
+        self.responses[url] = {
+            "url": url,
+            "status": status,
+            "headers": {key: value for key in self.HEADERS if (value := headers.get(key))},
+            "latency": latency,
+            "body": body_hash,
+        }
+
+    def write(self) -> None:
+        if not self.responses:
+            return
+
+        for body_hash, body in self._bodies.items():
+            path = self.directory / "bodies" / body_hash
+            if not path.exists():
+                write_atomic(path, body)
+        self._bodies.clear()
+
+        bundle = {"server_url": SERVER_URL, "responses": list(self.responses.values())}
+        write_atomic(self.directory / "bundle.json", json.dumps(bundle, indent=1).encode())
+
+recorder = Recorder(Path(RECORD_DIR)) if RECORD_DIR else None
+
+def record(url: str, status: int, headers: Mapping[str, str], start: float, body: bytes = b"") -> None:
+    if recorder:
+        recorder.record(url, status, headers, time.perf_counter() - start, body)
+
+def request_url(url: str, encoded: bool = False) -> str | URL:
+    """Where to send a request for `url`: the URL itself, or the `--replay` stand-in."""
+    if REPLAY_URL:
+        return URL(REPLAY_URL).with_query(url=url)
+
+    return URL(url, encoded=True) if encoded else url
+
+class XbarMenu:
+    """Buffered menu output: lines are kept with their submenu depth and written out in one go."""
+
+    def __init__(self):
+        self.lines: list[tuple[int, str]] = []
+        self.nesting = 0
 
+    @contextmanager
+    def submenu(self):
+        self.nesting += 1
+        try:
+            yield
+        finally:
+            self.nesting -= 1
+
+    def append(self, line: str) -> None:
+        self.lines.append((self.nesting, line))
+
+    @contextmanager
+    def capture(self):
+        """Collect the lines appended inside the block, with depths relative to the current one, for `extend`."""
+        start = len(self.lines)
+        nesting = self.nesting
+        fragment: list[tuple[int, str]] = []
+        try:
+            yield fragment
+        finally:
+            fragment.extend((depth - nesting, line) for depth, line in self.lines[start:])
+
+    def extend(self, fragment: list[tuple[int, str]]) -> None:
+        self.lines.extend((self.nesting + depth, line) for depth, line in fragment)
+
+    def append_rendered(self, output: str) -> None:
+        # Lines that were already rendered carry their own `--` prefixes
+        self.lines.extend((0, line) for line in output.splitlines())
+
+    def render(self) -> str:
+        return "".join("--" * nesting + line + "\n" for nesting, line in self.lines)
+
+    def clear(self) -> None:
+        self.lines.clear()
+        self.nesting = 0
+
+    def flush(self) -> None:
+        sys.stdout.write(self.render())
+        sys.stdout.flush()
+
+        self.clear()
+
+xbar_menu = XbarMenu()
+
+def xbar_submenu():
+    return xbar_menu.submenu()
+
+def xbar_sep():
+    xbar_menu.append("---")
+
+def xbar(text: Any | None = None, copy: bool | str = False, image: bytes | str | None = None, **params: Any):
     segments: list[str] = []
 
     if text:
@@ -105,7 +312,8 @@ def xbar(text: Any | None = None, copy: bool | str = False, image: bytes | None
         params["terminal"] = False
 
     if image:
-        params["image"] = base64.b64encode(image).decode()
+        # Strings are taken to be base64-encoded already
+        params["image"] = image if isinstance(image, str) else base64.b64encode(image).decode()
 
     params_segments = [f"{key}={value}" for key, value in params.items() if value is not None]
     if params_segments:
@@ -113,7 +321,7 @@ def xbar(text: Any | None = None, copy: bool | str = False, image: bytes | None
         segments.extend(params_segments)
 
     if segments:
-        print("--" * xbar_nesting + " ".join(segments), flush=True)
+        xbar_menu.append(" ".join(segments))
 
 
 def xbar_kv(label: str, value: Any, tabs: int = 0, **params: Any):
@@ -123,100 +331,582 @@ def xbar_kv(label: str, value: Any, tabs: int = 0, **params: Any):
     xbar("".join([label, "\t" * tabs, str(value)]), **params)
 
 
-async def resize_image_data(data: bytes, size: int) -> bytes:
-    if not shutil.which("sips"):
+class AvatarMask(str, Enum):
+    none = "none"
+    circle = "circle"
+
+AvatarSpec = tuple[str, int, AvatarMask]
+
+@functools.cache
+def circle_mask(width: int, height: int) -> "Image.Image":
+    from PIL import Image, ImageDraw
+
+    # Drawn at 4x and scaled down for smooth edges; as wide as the image and vertically centered
+    scale = 4
+    mask = Image.new("L", (width * scale, height * scale), 0)
+    top = (height - width) * scale // 2
+    ImageDraw.Draw(mask).ellipse((0, top, width * scale - 1, top + width * scale - 1), fill=255)
+
+    return mask.resize((width, height), Image.Resampling.LANCZOS)
+
+def transform_image_data(data: bytes, size: int, mask: AvatarMask) -> bytes | None:
+    from PIL import Image, ImageChops, UnidentifiedImageError
+
+    try:
+        with span("decode_image", bytes=len(data)), Image.open(io.BytesIO(data)) as original:
+            image = original.convert("RGBA")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return None
+
+    # Scale the longest side to 2x the point size, for Retina displays
+    with span("resize_image", size=size):
+        pixels = size * 2
+        scale = pixels / max(image.width, image.height)
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.Resampling.LANCZOS)
+
+    if mask == AvatarMask.circle:
+        with span("circle_image", size=size):
+            image.putalpha(ImageChops.multiply(image.getchannel("A"), circle_mask(image.width, image.height)))
+
+    with span("encode_image", size=size):
+        output = io.BytesIO()
+        image.save(output, format="PNG", dpi=(144, 144))
+
+    return output.getvalue()
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write to a temporary file and rename it into place, so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Unique per thread too, since writes run in `asyncio.to_thread`
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+class FileLock:
+    """Exclusive `flock` on a file in `LOCK_DIR`, released when its process dies."""
+
+    def __init__(self, name: str):
+        self.path = LOCK_DIR / f"{name}.lock"
+        self._fd: int | None = None
+
+    def try_acquire(self) -> bool:
+        if self._fd is None:
+            LOCK_DIR.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        return True
+
+    async def acquire(self, timeout: float | None = None) -> bool:
+        """Wait for the lock without blocking the event loop. Returns whether it was acquired within `timeout`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        try:
+            while not self.try_acquire():
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.release()
+                    return False
+
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+        except BaseException:
+            self.release()
+            raise
+
+        return True
+
+    def acquire_blocking(self) -> None:
+        self.try_acquire() or fcntl.flock(cast(int, self._fd), fcntl.LOCK_EX)
+
+    def release(self) -> None:
+        if self._fd is not None:
+            # Closing the file drops the lock
+            os.close(self._fd)
+            self._fd = None
+
+# Coroutines in this process wait on these rather than polling the file lock
+_key_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+@asynccontextmanager
+async def key_lock(key: str) -> AsyncIterator[None]:
+    """Hold the lock for a cache key while producing it, so each item is downloaded or transformed once."""
+    name = f"key-{hashlib.sha256(key.encode()).hexdigest()[:32]}"
+
+    async with _key_locks.setdefault(name, asyncio.Lock()):
+        lock = FileLock(name)
+
+        await lock.acquire()
+        try:
+            yield
+        finally:
+            lock.release()
+
+def prune_key_locks() -> int:
+    """Remove lock files for cache keys that nobody holds. Returns the number removed."""
+    removed = 0
+
+    for path in LOCK_DIR.glob("key-*.lock"):
+        lock = FileLock(path.stem)
+        try:
+            # A run racing the unlink can at worst produce that key twice, and writes are atomic
+            if lock.try_acquire():
+                path.unlink()
+                removed += 1
+        finally:
+            lock.release()
+
+    return removed
+
+class CacheEntry(NamedTuple):
+    size: int
+    created: float
+    accessed: float
+    sha256: str
+
+class Cache:
+    """Files in a directory, tracked by an LRU index whose hashes turn truncated or overwritten files into misses."""
+
+    def __init__(self, directory: Path, max_bytes: int, max_age: float):
+        self.directory = directory
+        self.index_path = directory / "index.json"
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._entries: OrderedDict[str, CacheEntry] | None = None
+        self._loaded_at = 0.0
+        self._total_bytes = 0
+        self._dirty = False
+        # Keys this process dropped, so `save` doesn't bring them back from another process's index
+        self._removed: set[str] = set()
+
+    def _read_index(self) -> OrderedDict[str, CacheEntry]:
+        entries: OrderedDict[str, CacheEntry] = OrderedDict()
+
+        try:
+            index = json.loads(self.index_path.read_bytes())
+            for key, size, created, accessed, sha256 in index["entries"]:
+                entries[key] = CacheEntry(size, created, accessed, sha256)
+        except (OSError, ValueError, KeyError, TypeError):
+            # Files without an index entry are misses, and get cleaned up by `prune`
+            entries.clear()
+
+        return entries
+
+    @property
+    def entries(self) -> OrderedDict[str, CacheEntry]:
+        if self._entries is None:
+            self._loaded_at = time.time()
+            self._entries = self._read_index()
+            self._total_bytes = sum(entry.size for entry in self._entries.values())
+
+        return self._entries
+
+    async def load(self) -> None:
+        if self._entries is None:
+            loaded_at = time.time()
+            entries = await asyncio.to_thread(self._read_index)
+
+            if self._entries is None:
+                self._loaded_at = loaded_at
+                self._entries = entries
+                self._total_bytes = sum(entry.size for entry in entries.values())
+
+    def created(self, key: str) -> float | None:
+        """When the entry was stored, or `None` if it's missing or expired. Doesn't read the file or count as a use."""
+        entry = self.entries.get(key)
+        if entry is None or time.time() - entry.created > self.max_age:
+            return None
+
+        return entry.created
+
+    def _read(self, key: str, entry: CacheEntry) -> bytes | None:
+        try:
+            data = (self.directory / key).read_bytes()
+        except OSError:
+            return None
+
+        if len(data) != entry.size or hashlib.sha256(data).hexdigest() != entry.sha256:
+            return None
+
         return data
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_dir_path = Path(temp_dir)
-        original_path = temp_dir_path / "original"
-        resized_path = temp_dir_path / "resized"
-
-        original_path.write_bytes(data)
-
-        process = await asyncio.create_subprocess_exec(
-            "sips",
-            original_path,
-            "-Z",
-            str(size * 2),
-            "-s",
-            "dpiHeight",
-            "144.0",
-            "-s",
-            "dpiWidth",
-            "144.0",
-            "--out",
-            resized_path,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        await process.wait()
+    async def get(self, key: str) -> bytes | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        if time.time() - entry.created > self.max_age:
+            await self.remove(key)
+            return None
 
-        data = resized_path.read_bytes()
+        data = await asyncio.to_thread(self._read, key, entry)
+        if data is None:
+            await self.remove(key)
+            return None
 
-    return data
+        # Another coroutine may have replaced or removed the entry while the file was read
+        if self.entries.get(key) == entry:
+            self.entries[key] = entry._replace(accessed=time.time())
+            self.entries.move_to_end(key)
+            self._dirty = True
 
-async def circle_image_data(data: bytes) -> bytes:
-    if not shutil.which("magick", path="/opt/homebrew/bin"):
         return data
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_dir_path = Path(temp_dir)
-        original_path = temp_dir_path / "original"
-        # circular_path = temp_dir_path / "circular"
-
-        original_path.write_bytes(data)
-
-        process = await asyncio.create_subprocess_exec(
-            "magick",  # Requires ImageMagick
-            original_path,
-            "-alpha",
-            "set",
-            "-virtual-pixel",
-            "transparent",
-            "-channel",
-            "A",
-            "-fx",
-            "hypot(i-w/2,j-h/2) < w/2 ? 1 : 0",
-            "png:-",
-            env={"PATH": "/opt/homebrew/bin"}, # TODO: Don't hardcode!
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL,
-        )
-        await process.wait()
+    def _read_new(self, key: str) -> bytes | None:
+        path = self.directory / key
 
-        # TODO: Why does this not always return a modified image, even though the command works by itself?
-        if process.stdout:
-            data = await process.stdout.read()
+        try:
+            # Older files missing from the index may predate atomic writes, so they're left for `prune`
+            if path.stat().st_mtime < self._loaded_at:
+                return None
+            return path.read_bytes()
+        except OSError:
+            return None
 
-    return data
+    async def adopt(self, key: str) -> bytes | None:
+        """Index a file another process stored since the index was loaded. Call under the key's `key_lock`."""
+        if key in self.entries:
+            return await self.get(key)
 
-async def read_url(url: str, session: aiohttp.ClientSession) -> bytes | None:
-    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        data = await asyncio.to_thread(self._read_new, key)
+        if data is None:
+            return None
 
-    url_hash = hashlib.sha256(url.encode()).hexdigest()
-    cache_file = CACHE_DIR / url_hash
+        self._forget(key)
+        self._removed.discard(key)
 
-    if cache_file.exists():
-        return cache_file.read_bytes()
+        now = time.time()
+        self.entries[key] = CacheEntry(len(data), now, now, hashlib.sha256(data).hexdigest())
+        self._total_bytes += len(data)
+        self._dirty = True
+
+        return data
+
+    def _write(self, key: str, data: bytes) -> str:
+        write_atomic(self.directory / key, data)
+        return hashlib.sha256(data).hexdigest()
+
+    async def put(self, key: str, data: bytes) -> None:
+        sha256 = await asyncio.to_thread(self._write, key, data)
+
+        self._forget(key)
+        self._removed.discard(key)
+
+        now = time.time()
+        self.entries[key] = CacheEntry(len(data), now, now, sha256)
+        self._total_bytes += len(data)
+        self._dirty = True
+
+        if evicted := self.evict():
+            await asyncio.to_thread(self._unlink, evicted)
+
+    def _forget(self, key: str) -> None:
+        if entry := self.entries.pop(key, None):
+            self._total_bytes -= entry.size
+            self._dirty = True
+
+        self._removed.add(key)
+
+    def _unlink(self, keys: list[str]) -> None:
+        for key in keys:
+            (self.directory / key).unlink(missing_ok=True)
+
+    async def remove(self, key: str) -> None:
+        self._forget(key)
+        await asyncio.to_thread(self._unlink, [key])
+
+    def evict(self) -> list[str]:
+        """Drop least recently used entries from the index until it fits in `max_bytes`. Returns their keys, whose files still need removing."""
+        evicted: list[str] = []
+        while self._total_bytes > self.max_bytes and self.entries:
+            key = next(iter(self.entries))
+            self._forget(key)
+            evicted.append(key)
+
+        return evicted
+
+    def prune(self) -> tuple[int, int]:
+        """Remove expired entries and files missing from the index. Returns the number of files and bytes removed."""
+        removed_files = 0
+        removed_bytes = 0
+
+        now = time.time()
+        for key, entry in list(self.entries.items()):
+            if now - entry.created > self.max_age:
+                self._forget(key)
+                self._unlink([key])
+                removed_files += 1
+                removed_bytes += entry.size
+
+        if self.directory.exists():
+            for path in self.directory.rglob("*"):
+                key = path.relative_to(self.directory).as_posix()
+                if path.is_file() and path != self.index_path and key not in self.entries:
+                    removed_files += 1
+                    removed_bytes += path.stat().st_size
+                    path.unlink()
+
+        self._dirty = True
+        self.save()
+
+        return removed_files, removed_bytes
+
+    def stats(self) -> dict[str, Any]:
+        now = time.time()
+        entries = self.entries.values()
+
+        return {
+            "entries": len(entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "expired": sum(1 for entry in entries if now - entry.created > self.max_age),
+            "oldest_age": max((now - entry.created for entry in entries), default=0),
+        }
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+
+        lock = FileLock("cache-index")
+        lock.acquire_blocking()
+        try:
+            # Keep what overlapping runs stored since the index was loaded, rather than overwriting it
+            for key, entry in self._read_index().items():
+                if key not in self.entries and key not in self._removed:
+                    self.entries[key] = entry
+                    self._total_bytes += entry.size
+
+            ordered = sorted(self.entries.items(), key=lambda item: item[1].accessed)
+            self.entries.clear()
+            self.entries.update(ordered)
+
+            self._unlink(self.evict())
+
+            index = {"entries": [[key, *entry] for key, entry in self.entries.items()]}
+            write_atomic(self.index_path, json.dumps(index, separators=(",", ":")).encode())
+        finally:
+            lock.release()
+
+        self._dirty = False
+
+cache = Cache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_AGE)
+
+def url_cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+class FailureKind(str, Enum):
+    client = "client"
+    server = "server"
+
+class Failure(NamedTuple):
+    kind: FailureKind
+    count: int
+    retry_at: float
+
+class Failures:
+    """URLs that failed to download recently, by URL hash, with when they may be tried again."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+        self._entries: dict[str, Failure] | None = None
+        self._dirty = False
+
+    def _read(self) -> dict[str, Failure]:
+        entries: dict[str, Failure] = {}
+
+        try:
+            for key, kind, count, retry_at in json.loads(self.path.read_bytes()):
+                entries[key] = Failure(FailureKind(kind), count, retry_at)
+        except (OSError, ValueError, TypeError):
+            entries.clear()
+
+        return entries
+
+    @property
+    def entries(self) -> dict[str, Failure]:
+        if self._entries is None:
+            self._entries = self._read()
+
+        return self._entries
+
+    async def load(self) -> None:
+        if self._entries is None:
+            entries = await asyncio.to_thread(self._read)
+
+            if self._entries is None:
+                self._entries = entries
+
+    def blocked(self, url: str) -> bool:
+        failure = self.entries.get(url_cache_key(url))
+        return failure is not None and time.time() < failure.retry_at
+
+    def record(self, url: str, kind: FailureKind) -> None:
+        key = url_cache_key(url)
+
+        previous = self.entries.get(key)
+        count = previous.count + 1 if previous and previous.kind == kind else 1
+
+        base = CLIENT_ERROR_BACKOFF if kind == FailureKind.client else SERVER_ERROR_BACKOFF
+        self.entries[key] = Failure(kind, count, time.time() + min(base * 2 ** (count - 1), MAX_BACKOFF))
+        self._dirty = True
+
+    def clear(self, url: str) -> None:
+        if self.entries.pop(url_cache_key(url), None):
+            self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+
+        # URLs that haven't been retried in a long time are probably no longer on the menu
+        now = time.time()
+        entries = [[key, *failure] for key, failure in self.entries.items() if now - failure.retry_at < MAX_BACKOFF]
+        write_atomic(self.path, json.dumps(entries, separators=(",", ":")).encode())
+
+        self._dirty = False
+
+failures = Failures(FAILURES_PATH)
+
+# `urls/<url hash>` holds the hash of what the URL served and `blobs/<content hash>` the image, so URLs share blobs
+def url_map_key(url: str) -> str:
+    return f"urls/{url_cache_key(url)}"
+
+async def url_content_hash(url: str) -> str | None:
+    """The hash of what the URL served last, without reading the image."""
+    data = await cache.get(url_map_key(url))
+    return data.decode() if data else None
+
+async def read_url(url: str, session: aiohttp.ClientSession) -> tuple[str, bytes] | None:
+    """The content hash and data of the image at `url`."""
+    with span("read_url", url=url):
+        return await _read_url(url, session)
+
+async def _read_url(url: str, session: aiohttp.ClientSession) -> tuple[str, bytes] | None:
+    map_key = url_map_key(url)
+
+    # Recordings download everything, since replays start without a cache
+    if not recorder:
+        if (content_hash := await url_content_hash(url)) and (data := await cache.get(f"blobs/{content_hash}")) is not None:
+            return content_hash, data
+
+        # Broken avatars wait out their backoff, so the menu falls back to a symbol right away
+        if failures.blocked(url):
+            return None
+
+    async with key_lock(map_key):
+        if not recorder and (mapped := await cache.adopt(map_key)) and (data := await cache.adopt(f"blobs/{mapped.decode()}")) is not None:
+            return mapped.decode(), data
+
+        start = time.perf_counter()
+        try:
+            async with session.get(request_url(url, encoded=True), timeout=aiohttp.ClientTimeout(total=AVATAR_TIMEOUT)) as response:
+                data = await response.read()
+                record(url, response.status, response.headers, start, data)
+        except aiohttp.ClientResponseError as err:
+            record(url, err.status, err.headers or {}, start)
+
+            # Timeouts and rate limits are worth retrying sooner than other client errors
+            client_error = 400 <= err.status < 500 and err.status not in (408, 429)
+            failures.record(url, FailureKind.client if client_error else FailureKind.server)
+            return None
+        except (aiohttp.InvalidURL, ValueError):
+            # A malformed URL won't fix itself
+            failures.record(url, FailureKind.client)
+            return None
+        except (aiohttp.ClientError, TimeoutError):
+            # Connection errors, timeouts, and responses cut short
+            record(url, 0, {}, start)
+
+            failures.record(url, FailureKind.server)
+            return None
+
+        failures.clear(url)
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        blob_key = f"blobs/{content_hash}"
+
+        # Another URL may already have brought in the same image
+        if await cache.adopt(blob_key) is None:
+            await cache.put(blob_key, data)
+        await cache.put(map_key, content_hash.encode())
+
+        return content_hash, data
+
+APIResponse = tuple[bytes, dict[str, str]]
+
+def read_api_response(url: str) -> APIResponse | None:
+    """Blocking; call through `asyncio.to_thread`."""
+    url_hash = hashlib.sha256(url.encode()).hexdigest()
 
     try:
-        async with session.get(URL(url, encoded=True)) as response:
-            data = await response.read()
-            cache_file.write_bytes(data)
+        body = (API_CACHE_DIR / url_hash).read_bytes()
+        meta = json.loads((API_CACHE_DIR / f"{url_hash}.validators").read_bytes())
+    except (OSError, ValueError):
+        return None
 
-            return data
-    except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError):
+    # Both files are replaced atomically but not together, so a body from another write shows up as a mismatch
+    if not isinstance(meta, dict) or meta.pop("_sha256", None) != hashlib.sha256(body).hexdigest():
         return None
 
-class Network(BaseModel):
+    return body, meta
+
+def write_api_response(url: str, body: bytes, validators: dict[str, str]) -> None:
+    """Blocking; call through `asyncio.to_thread`."""
+    url_hash = hashlib.sha256(url.encode()).hexdigest()
+
+    write_atomic(API_CACHE_DIR / url_hash, body)
+    write_atomic(API_CACHE_DIR / f"{url_hash}.validators", json.dumps(validators | {"_sha256": hashlib.sha256(body).hexdigest()}).encode())
+
+def derived_key(content_hash: str, size: int, mask: AvatarMask) -> str:
+    return f"derived/{content_hash}-{size}-{mask.value}"
+
+async def avatar_image_data(url: str, session: aiohttp.ClientSession, size: int, mask: AvatarMask = AvatarMask.none) -> bytes | None:
+    # A known URL goes straight to the derived image, without reading the original (unless it's to be recorded)
+    if not recorder and (content_hash := await url_content_hash(url)) and (derived := await cache.get(derived_key(content_hash, size, mask))) is not None:
+        return derived
+
+    result = await read_url(url, session)
+    if not result:
+        return None
+
+    # Derived images are keyed by content rather than URL, so an avatar that changes upstream gets transformed again
+    content_hash, data = result
+    key = derived_key(content_hash, size, mask)
+
+    if (derived := await cache.get(key)) is not None:
+        return derived
+
+    async with key_lock(key):
+        if (derived := await cache.adopt(key)) is not None:
+            return derived
+
+        data = await asyncio.to_thread(transform_image_data, data, size, mask)
+
+        if data:
+            await cache.put(key, data)
+
+        return data
+
+class Model(BaseModel):
+    # Build validators on first use instead of at import, so runs that never get to validation don't pay for them
+    model_config = ConfigDict(defer_build=True)
+
+class Network(Model):
     id: str
     display_name: str
 
-    class Attrs(BaseModel):
+    class Attrs(Model):
         sf_symbol: str | None = None
 
-    attrs: Attrs = Attrs()
+    attrs: Attrs = Field(default_factory=Attrs)
 
     @property
     def sf_symbol(self) -> str | None:
@@ -251,7 +941,7 @@ class DeviceType(str, Enum):
             case _:
                 return None
 
-class Device(BaseModel):
+class Device(Model):
     known: bool
     ids: list[str]
     display_name: str
@@ -266,65 +956,66 @@ class Device(BaseModel):
     def sf_symbol(self) -> str | None:
         return self.type.sf_symbol if self.type else None
 
-class Person(BaseModel):
+class Person(Model):
     known: bool
     id: str
     display_name: str
 
     avatar_url: str | None
 
-    class Attrs(BaseModel):
+    class Attrs(Model):
         phone: str | None = None
         email: str | None = None
         door_code: str | int | None = None
 
         sf_symbol: str | None = None
 
-    attrs: Attrs = Attrs()
+    attrs: Attrs = Field(default_factory=Attrs)
 
     @property
     def sf_symbol(self) -> str | None:
         return self.attrs.sf_symbol
 
-    async def avatar(self, session: aiohttp.ClientSession, size: int = 32) -> bytes | None:
+    def avatar_spec(self, size: int = AVATAR_SIZE) -> AvatarSpec | None:
         avatar_url = self.avatar_url
         if not avatar_url:
             return None
 
-        data = await read_url(avatar_url, session)
-        if not data:
-            return None
-
-        data = await resize_image_data(data, size)
         # TODO: Apply circle mask only on avatars, NOT on default device image (shouldn't be needed anyway?)
-        data = await circle_image_data(data)
-
-        return data
+        return (avatar_url, size, AvatarMask.circle)
 
-class Role(BaseModel):
+class Role(Model):
     id: str
     display_name: str
 
-    class Attrs(BaseModel):
+    class Attrs(Model):
         sf_symbol: str | None = None
 
-    attrs: Attrs = Attrs()
+    attrs: Attrs = Field(default_factory=Attrs)
 
     @property
     def sf_symbol(self) -> str | None:
         return self.attrs.sf_symbol
 
-class Home(BaseModel):
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Role):
+            return self.id == other.id
+        return False
+
+class Home(Model):
     id: str
     display_name: str
     connected: bool | None = None
 
-    class Attrs(BaseModel):
-        class Wifi(BaseModel):
+    class Attrs(Model):
+        class Wifi(Model):
             ssid: str | None = None
             password: str | None = None
 
-        class Address(BaseModel):
+        class Address(Model):
             street: str | None = None
             neighborhood: str | None = None
             postal_code: str | int | None = None
@@ -338,15 +1029,15 @@ class Home(BaseModel):
                 query = ", ".join(parts)
                 return f"https://www.google.com/maps/search/?api=1&query={urllib.parse.quote_plus(query)}"
 
-        class Link(BaseModel):
+        class Link(Model):
             label: str
             url: str
 
-            class Attrs(BaseModel):
+            class Attrs(Model):
                 sf_symbol: str | None = None
                 roles: list[str] | None = None
 
-            attrs: Attrs = Attrs()
+            attrs: Attrs = Field(default_factory=Attrs)
 
             @property
             def sf_symbol(self) -> str | None:
@@ -361,7 +1052,7 @@ class Home(BaseModel):
         address: Address | None = None
         wifi: Wifi | None = None
 
-        class DoorCode(BaseModel):
+        class DoorCode(Model):
             prefix: str | None = None
             code: str | int | None = None
 
@@ -369,7 +1060,7 @@ class Home(BaseModel):
 
         avatar_url: str | None = None
 
-    attrs: Attrs = Attrs()
+    attrs: Attrs = Field(default_factory=Attrs)
 
     def door_code(self, person: Person | None = None) -> str | None:
         door_code = self.attrs.door_code
@@ -399,27 +1090,21 @@ class Home(BaseModel):
             return self.id == other.id
         return False
 
-    async def avatar(self, session: aiohttp.ClientSession, size: int = 32) -> bytes | None:
+    def avatar_spec(self, size: int = AVATAR_SIZE) -> AvatarSpec | None:
         avatar_url = self.avatar_url
         if not avatar_url:
             return None
 
-        data = await read_url(avatar_url, session)
-        if not data:
-            return None
-
-        data = await resize_image_data(data, size)
+        return (avatar_url, size, AvatarMask.none)
 
-        return data
-
-class Room(BaseModel):
+class Room(Model):
     id: str
     display_name: str
 
-    class Attrs(BaseModel):
+    class Attrs(Model):
         sf_symbol: str | None = None
 
-    attrs: Attrs = Attrs()
+    attrs: Attrs = Field(default_factory=Attrs)
 
     @property
     def sf_symbol(self) -> str | None:
@@ -433,7 +1118,7 @@ class Room(BaseModel):
             return self.id == other.id
         return False
 
-class Metadata(BaseModel):
+class Metadata(Model):
     model_config = ConfigDict(extra="allow")
 
     ip: str | None = None
@@ -441,9 +1126,22 @@ class Metadata(BaseModel):
     mac_is_private: bool = False
     wifi_ssid: str | None = None
 
-    country: CountryAlpha2 | None = None
+    country: str | None = None
+
+    @property
+    def country_name(self) -> str | None:
+        if not self.country:
+            return None
+
+        # Imported here because it loads the pycountry database
+        from pydantic_extra_types.country import CountryAlpha2
+
+        try:
+            return TypeAdapter(CountryAlpha2).validate_python(self.country).short_name
+        except ValidationError:
+            return self.country
 
-class Connection(BaseModel):
+class Connection(Model):
     summary: str
 
     known: bool
@@ -468,7 +1166,10 @@ class Connection(BaseModel):
             return self.network.id == other.network.id and self.active_ids == other.active_ids
         return False
 
-class ConnectedPerson(BaseModel):
+    def __hash__(self) -> int:
+        return hash((self.network.id, tuple(self.active_ids)))
+
+class ConnectedPerson(Model):
     known: bool
 
     person: Person
@@ -480,97 +1181,296 @@ class ConnectedPerson(BaseModel):
 
     connection: Connection
 
+# Built on first use, like the models
+CONNECTION_ADAPTER = TypeAdapter(Connection)
+CONNECTIONS_ADAPTER = TypeAdapter(list[Connection], config=ConfigDict(defer_build=True))
+HOMES_ADAPTER = TypeAdapter(list[Home], config=ConfigDict(defer_build=True))
+CONNECTED_PEOPLE_ADAPTER = TypeAdapter(list[ConnectedPerson], config=ConfigDict(defer_build=True))
+
+class RoomPeople(NamedTuple):
+    """The people in a room as they're listed on the menu."""
+    # Known people, with avatars and details
+    shown: list[ConnectedPerson]
+    # Unknown people, grouped by role
+    unknown: OrderedDict[Role, list[ConnectedPerson]]
+    # Known people past `ROOM_PEOPLE_LIMIT` or `HOME_PEOPLE_LIMIT`
+    overflow: list[ConnectedPerson]
+
 class WelcomeApp:
     def __init__(self):
+        # Base64-encoded avatars, loaded once per refresh; later refreshes retry failures via the disk cache
+        self._avatars: dict[AvatarSpec, asyncio.Task[str | None]] = {}
+        # Avatar loads that outlived the refresh that started them; they still fill the disk cache
+        self._background_avatars: set[asyncio.Task[str | None]] = set()
+
+        self.reset()
+
+        self._revalidations: set[asyncio.Task[bytes]] = set()
+
+        self._session: aiohttp.ClientSession | None = None
+        self._avatar_session: aiohttp.ClientSession | None = None
+        self._cookie_jar = CookieJar()
+        self._saved_cookies = self._load_cookies()
+
+    def reset(self) -> None:
+        """Forget fetched data so the next render requests it again. The session is kept."""
         self._connection: Connection | None = None
         self._homes: list[Home] | None = None
         self._my_connections: list[Connection] | None = None
         self._connected_people: list[ConnectedPerson] | None = None
         self._person_connections: dict[str, list[Connection]] = defaultdict(list)
         self._device_connections: dict[str, list[Connection]] = defaultdict(list)
+        # Raw response bodies by URL, to tell whether anything changed since the last render
+        self._payloads: dict[str, bytes] = {}
+        # Rendered `xbar_connection_details` lines, which show up under several menu items
+        self._connection_details: dict[Connection, list[tuple[int, str]]] = {}
 
-        self._session: aiohttp.ClientSession | None = None
-        self._cookie_jar = CookieJar()
-        self._load_cookies()
+        self._deadline = time.monotonic() + REFRESH_DEADLINE
+        # Menu sections left incomplete because the deadline passed
+        self.degraded: set[str] = set()
+
+        for task in self._avatars.values():
+            if not task.done():
+                self._background_avatars.add(task)
+                task.add_done_callback(self._background_avatars.discard)
+        self._avatars = {}
 
-    def _load_cookies(self) -> None:
+    @property
+    def time_left(self) -> float:
+        return self._deadline - time.monotonic()
+
+    def _dump_cookies(self) -> bytes:
+        cookies = self._cookie_jar.filter_cookies(URL(SERVER_URL))
+        return json.dumps({name: morsel.value for name, morsel in cookies.items()}, sort_keys=True).encode()
+
+    def _load_cookies(self) -> bytes | None:
+        """Load cookies into the jar and return them as last saved, so `save_cookies` can tell whether they changed."""
         try:
-            if COOKIE_PATH.exists():
-                with COOKIE_PATH.open('rb') as f:
-                    cookies = pickle.load(f)
-                    self._cookie_jar.update_cookies(cookies)
-        except:
-            pass
+            cookies = json.loads(COOKIE_PATH.read_bytes())
+        except FileNotFoundError:
+            if self._load_legacy_cookies():
+                return None
+            return self._dump_cookies()
+        except (OSError, ValueError):
+            return None
+
+        self._cookie_jar.update_cookies(cookies)
+
+        return self._dump_cookies()
+
+    def _load_legacy_cookies(self) -> bool:
+        # Older versions pickled the cookies; they're converted to JSON on the next save
+        if not LEGACY_COOKIE_PATH.exists():
+            return False
+
+        import pickle
 
-    def _save_cookies(self) -> None:
         try:
-            with COOKIE_PATH.open('wb') as f:
-                cookies = self._cookie_jar.filter_cookies(URL(SERVER_URL))
-                pickle.dump(cookies, f)
-        except:
-            pass
+            with LEGACY_COOKIE_PATH.open("rb") as f:
+                self._cookie_jar.update_cookies(pickle.load(f))
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+            return False
+
+        return True
+
+    def save_cookies(self) -> None:
+        cookies = self._dump_cookies()
+        if cookies == self._saved_cookies:
+            return
+
+        write_atomic(COOKIE_PATH, cookies)
+        LEGACY_COOKIE_PATH.unlink(missing_ok=True)
+
+        self._saved_cookies = cookies
 
     @property
     def session(self) -> aiohttp.ClientSession:
         if self._session is None:
             self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    # Everything goes to a single host
+                    limit=API_CONNECTION_LIMIT,
+                    ttl_dns_cache=DNS_CACHE_TTL,
+                    keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ),
                 raise_for_status=True,
-                cookie_jar=self._cookie_jar
+                cookie_jar=self._cookie_jar,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
             )
 
         return self._session
 
-    async def request(self, url: str, raise_for_status: bool = False) -> list[dict[str, Any]] | dict[str, Any] | None:
+    @property
+    def avatar_session(self) -> aiohttp.ClientSession:
+        """Session for avatars on other hosts, which get neither the API's connections nor its cookies."""
+        if self._avatar_session is None:
+            self._avatar_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=AVATAR_CONNECTION_LIMIT,
+                    limit_per_host=AVATAR_CONNECTION_LIMIT_PER_HOST,
+                    ttl_dns_cache=DNS_CACHE_TTL,
+                    keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ),
+                raise_for_status=True,
+                cookie_jar=aiohttp.DummyCookieJar(),
+                timeout=aiohttp.ClientTimeout(total=AVATAR_TIMEOUT)
+            )
+
+        return self._avatar_session
+
+    def session_for(self, url: str) -> aiohttp.ClientSession:
+        # Avatars served by the Welcome server itself may need its session cookie
+        try:
+            if URL(url).origin() == URL(SERVER_URL).origin():
+                return self.session
+        except ValueError:
+            # Not an absolute URL; the download fails and gets backed off
+            pass
+
+        return self.avatar_session
+
+    async def close(self) -> None:
+        # The menu is out by now, so let these finish (each within its timeout) for the next run
+        await asyncio.gather(*self._revalidations, *self._avatars.values(), *self._background_avatars, return_exceptions=True)
+
+        for session in (self._session, self._avatar_session):
+            if session:
+                await session.close()
+
+        self.save_cookies()
+
+    async def _fetch(self, url: str, stored: APIResponse | None) -> bytes:
+        headers: dict[str, str] = {}
+        if stored:
+            _, validators = stored
+            if etag := validators.get("ETag"):
+                headers["If-None-Match"] = etag
+            if last_modified := validators.get("Last-Modified"):
+                headers["If-Modified-Since"] = last_modified
+
+        start = time.perf_counter()
         try:
-            response = await self.session.get(url)
-            self._save_cookies()
+            async with self.session.get(request_url(url), headers=headers) as response:
+                if stored and response.status == 304:
+                    body, _ = stored
+                    record(url, response.status, response.headers, start, body)
+                    return body
+
+                # The check `response.json()` makes, so a captive portal or proxy error page is neither stored nor parsed
+                mimetype = response.content_type
+                if not (mimetype == "application/json" or mimetype.startswith("application/") and mimetype.endswith("+json")):
+                    raise aiohttp.ContentTypeError(
+                        response.request_info,
+                        response.history,
+                        status=response.status,
+                        message=f"Attempt to decode JSON with unexpected mimetype: {mimetype}",
+                        headers=response.headers,
+                    )
+
+                body = await response.read()
+                record(url, response.status, response.headers, start, body)
+
+                validators = {key: value for key in ("ETag", "Last-Modified") if (value := response.headers.get(key))}
+                await asyncio.to_thread(write_api_response, url, body, validators)
+
+                return body
+        except aiohttp.ClientResponseError as err:
+            record(url, err.status, err.headers or {}, start)
+            raise
+        except (aiohttp.ClientConnectionError, TimeoutError):
+            record(url, 0, {}, start)
+            raise
+
+    async def request[T](self, url: str, adapter: TypeAdapter[T], raise_for_status: bool = False) -> T | None:
+        with span("request", url=url):
+            body = await self._request(url, raise_for_status)
+
+        if body is None:
+            return None
 
-            return await response.json()
-        except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError):
+        # Validating straight from the bytes skips building intermediate dicts and lists
+        try:
+            with span("validate", url=url, bytes=len(body)):
+                return adapter.validate_json(body)
+        except ValidationError:
             if raise_for_status:
                 raise
             return None
 
+    async def _request(self, url: str, raise_for_status: bool = False) -> bytes | None:
+        # Recordings skip the stored snapshots, so every body ends up in the bundle rather than a 304
+        stored = None if recorder else await asyncio.to_thread(read_api_response, url)
+
+        # `/api/me` is how we detect that the server is reachable, so it's never served stale
+        if stored and STALE_WHILE_REVALIDATE and not raise_for_status:
+            revalidation = asyncio.create_task(self._fetch(url, stored))
+            self._revalidations.add(revalidation)
+            revalidation.add_done_callback(self._revalidations.discard)
+
+            body, _ = stored
+            self._payloads[url] = body
+            return body
+
+        try:
+            body = await self._fetch(url, stored)
+        except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError, TimeoutError):
+            if raise_for_status:
+                raise
+            return None
+
+        self._payloads[url] = body
+        return body
+
     @property
     async def connection(self) -> Connection:
         if self._connection is None:
-            raw_connection = await self.request(f"{SERVER_URL}/api/me", raise_for_status=True)
-            self._connection = Connection.model_validate(raw_connection)
+            # Raises rather than returning `None`
+            self._connection = cast(Connection, await self.request(f"{SERVER_URL}/api/me", CONNECTION_ADAPTER, raise_for_status=True))
 
         return self._connection
 
     @property
     async def homes(self) -> list[Home]:
         if self._homes is None:
-            raw_homes = await self.request(f"{SERVER_URL}/api/homes") or []
-            self._homes = [Home.model_validate(raw) for raw in raw_homes]
+            self._homes = await self.request(f"{SERVER_URL}/api/homes", HOMES_ADAPTER) or []
 
         return self._homes
 
     @property
     async def my_connections(self) -> list[Connection]:
         if self._my_connections is None:
-            raw_connections = await self.request(f"{SERVER_URL}/api/me/connections") or []
-            self._my_connections = [Connection.model_validate(raw) for raw in raw_connections]
+            self._my_connections = await self.request(f"{SERVER_URL}/api/me/connections", CONNECTIONS_ADAPTER) or []
 
         return self._my_connections
 
     @property
     async def connected_people(self) -> list[ConnectedPerson]:
         if self._connected_people is None:
-            raw_people = await self.request(f"{SERVER_URL}/api/homes/people") or []
-            self._connected_people = [ConnectedPerson.model_validate(raw) for raw in raw_people]
+            self._connected_people = await self.request(f"{SERVER_URL}/api/homes/people", CONNECTED_PEOPLE_ADAPTER) or []
 
         return self._connected_people
 
+    async def bootstrap(self) -> None:
+        results = await asyncio.gather(
+            self.connection,
+            self.homes,
+            self.my_connections,
+            self.connected_people,
+            return_exceptions=True,
+        )
+
+        # Only `/api/me` raises on connection errors; re-raise in order so that's the one callers see
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
     async def device_connections(self, device: Device) -> list[Connection]:
         if not device.known:
             return []
 
         id = device.ids[0]
         if id not in self._device_connections:
-            raw_connections = await self.request(f"{SERVER_URL}/api/devices/{id}/connections") or []
-            self._device_connections[id] = [Connection.model_validate(raw) for raw in raw_connections]
+            self._device_connections[id] = await self.request(f"{SERVER_URL}/api/devices/{id}/connections", CONNECTIONS_ADAPTER) or []
 
         return self._device_connections[id]
 
@@ -579,11 +1479,38 @@ class WelcomeApp:
             return []
 
         if person.id not in self._person_connections:
-            raw_connections = await self.request(f"{SERVER_URL}/api/people/{person.id}/connections") or []
-            self._person_connections[person.id] = [Connection.model_validate(raw) for raw in raw_connections]
+            if self.time_left <= 0:
+                self.degraded.add("Devices")
+                return []
+
+            self._person_connections[person.id] = await self.request(f"{SERVER_URL}/api/people/{person.id}/connections", CONNECTIONS_ADAPTER) or []
 
         return self._person_connections[person.id]
 
+    async def prefetch_person_connections(self) -> None:
+        # The same person can be listed in multiple homes, so dedupe by ID
+        people: dict[str, Person] = {}
+
+        connection = await self.connection
+        if connection.person:
+            people[connection.person.id] = connection.person
+
+        # Only people listed in full show their devices
+        for connected_person in await self.shown_people():
+            people.setdefault(connected_person.person.id, connected_person.person)
+
+        semaphore = asyncio.Semaphore(REQUEST_CONCURRENCY)
+
+        async def prefetch(person: Person) -> None:
+            async with semaphore:
+                await self.person_connections(person)
+
+        try:
+            async with asyncio.timeout(self.time_left):
+                await asyncio.gather(*(prefetch(person) for person in people.values() if person.known))
+        except TimeoutError:
+            self.degraded.add("Devices")
+
     @property
     async def home_room_people(self) -> OrderedDict[Home, OrderedDict[Room | None, list[ConnectedPerson]]]:
         home_room_people: OrderedDict[Home, OrderedDict[Room | None, list[ConnectedPerson]]] = OrderedDict()
@@ -615,6 +1542,137 @@ class WelcomeApp:
 
         return home_room_people
 
+    @property
+    async def home_room_layout(self) -> OrderedDict[Home, OrderedDict[Room | None, RoomPeople]]:
+        """`home_room_people` with the per-room and per-home limits applied, so the menu doesn't grow with occupancy."""
+        layout: OrderedDict[Home, OrderedDict[Room | None, RoomPeople]] = OrderedDict()
+
+        for home, room_people in (await self.home_room_people).items():
+            home_left = HOME_PEOPLE_LIMIT or math.inf
+            rooms = layout[home] = OrderedDict()
+
+            for room, people in room_people.items():
+                room_left = min(ROOM_PEOPLE_LIMIT or math.inf, home_left)
+                rooms[room] = layout_room = RoomPeople([], OrderedDict(), [])
+
+                for connected_person in people:
+                    if not connected_person.person.known:
+                        layout_room.unknown.setdefault(connected_person.role, []).append(connected_person)
+                    elif len(layout_room.shown) < room_left:
+                        layout_room.shown.append(connected_person)
+                    else:
+                        layout_room.overflow.append(connected_person)
+
+                home_left -= len(layout_room.shown)
+
+        return layout
+
+    async def shown_people(self) -> list[ConnectedPerson]:
+        return [
+            connected_person
+            for rooms in (await self.home_room_layout).values()
+            for room_people in rooms.values()
+            for connected_person in room_people.shown
+        ]
+
+    async def _load_avatar(self, spec: AvatarSpec) -> str | None:
+        url, size, mask = spec
+
+        try:
+            data = await avatar_image_data(url, self.session_for(url), size, mask)
+        except Exception:
+            # No avatar is worth failing the menu over; `xbar_person` falls back to a symbol
+            return None
+
+        return base64.b64encode(data).decode() if data else None
+
+    async def avatar(self, spec: AvatarSpec | None) -> str | None:
+        if spec is None:
+            return None
+
+        task = self._avatars.get(spec)
+        if task is None:
+            if self.time_left <= 0:
+                self.degraded.add("Avatars")
+                return None
+
+            task = self._avatars[spec] = asyncio.create_task(self._load_avatar(spec))
+        elif not task.done() and self.time_left <= 0:
+            # Still loading after the deadline; it keeps going and fills the disk cache for the next refresh
+            self.degraded.add("Avatars")
+            return None
+
+        # Shielded so a caller that times out doesn't cancel the load for everyone else
+        return await asyncio.shield(task)
+
+    async def avatar_specs(self) -> set[AvatarSpec]:
+        specs: set[AvatarSpec | None] = set()
+
+        connection = await self.connection
+        if connection.person:
+            specs.add(connection.person.avatar_spec())
+
+        home_room_people = await self.home_room_people
+        for home in home_room_people:
+            specs.add(home.avatar_spec())
+
+        # Overflow and unknown people are listed without avatars
+        for connected_person in await self.shown_people():
+            specs.add(connected_person.person.avatar_spec(PEOPLE_AVATAR_SIZE))
+
+        specs.discard(None)
+        return cast(set[AvatarSpec], specs)
+
+    async def prefetch_avatars(self) -> None:
+        specs = await self.avatar_specs()
+
+        semaphore = asyncio.Semaphore(AVATAR_CONCURRENCY)
+
+        async def prefetch(spec: AvatarSpec) -> None:
+            async with semaphore:
+                await self.avatar(spec)
+
+        try:
+            async with asyncio.timeout(self.time_left):
+                await asyncio.gather(*(prefetch(spec) for spec in specs), return_exceptions=True)
+        except TimeoutError:
+            self.degraded.add("Avatars")
+
+    async def fingerprint(self) -> str:
+        """Hash everything the menu is rendered from: settings, API responses, and which avatars are cached."""
+        digest = hashlib.sha256()
+
+        settings = sorted((key, value) for key, value in os.environ.items() if key.startswith("WELCOME_"))
+        digest.update(json.dumps([SERVER_URL, os.getenv("SWIFTBAR"), Path(__file__).stat().st_mtime_ns, settings]).encode())
+
+        for url, body in sorted(self._payloads.items()):
+            digest.update(url.encode())
+            digest.update(hashlib.sha256(body).digest())
+
+        # A changed, expired or evicted avatar changes the creation time of its URL's mapping
+        for url, size, mask in sorted(await self.avatar_specs()):
+            digest.update(f"{url} {size} {mask.value} {cache.created(url_map_key(url))}".encode())
+
+        return digest.hexdigest()
+
+    async def read_last_render(self, fingerprint: str) -> str | None:
+        try:
+            last_fingerprint, output = (await asyncio.to_thread(LAST_RENDER_PATH.read_text)).split("\n", 1)
+        except (OSError, ValueError):
+            return None
+
+        return output if last_fingerprint == fingerprint else None
+
+    async def write_last_render(self, fingerprint: str, output: str) -> None:
+        await asyncio.to_thread(write_atomic, LAST_RENDER_PATH, f"{fingerprint}\n{output}".encode())
+
+    async def touch_last_render(self) -> None:
+        """Mark the last render as current, for runs waiting in `wait_for_other_run`."""
+        try:
+            await asyncio.to_thread(LAST_RENDER_PATH.touch)
+        except OSError:
+            pass
+
     async def xbar_welcome(self):
         connection = await self.connection
 
@@ -677,7 +1735,7 @@ class WelcomeApp:
                 await self.xbar_connection_details(conn)
 
     async def xbar_home(self, home: Home, avatar: bool = True, **params: Any):
-        if avatar and (image := await home.avatar(self.session, size=20)):
+        if avatar and (image := await self.avatar(home.avatar_spec())):
             params["image"] = image
         else:
             params["sfimage"] = "house"
@@ -733,15 +1791,23 @@ class WelcomeApp:
     def xbar_room(self, room: Room, **params: Any):
         xbar(room.display_name, sfimage=room.sf_symbol or "door.left.hand.open", **params)
 
-    async def xbar_person(self, person: Person, avatar_size: int = 20, prefix: str = "", suffix: str = "", **params: Any):
-        avatar = await person.avatar(self.session, size=avatar_size)
-        if avatar:
-            params["image"] = avatar
+    async def xbar_person(self, person: Person, avatar_size: int = AVATAR_SIZE, prefix: str = "", suffix: str = "", avatar: bool = True, **params: Any):
+        if avatar and (image := await self.avatar(person.avatar_spec(avatar_size))):
+            params["image"] = image
         else:
             params["sfimage"] = person.sf_symbol or ("person.fill" if person.known else "person.fill.questionmark")
 
         xbar(prefix + person.display_name + suffix, **params)
 
+    async def xbar_people_list(self, people: list[ConnectedPerson]):
+        """Just the names, for people who don't fit on the menu in full."""
+        limit = PEOPLE_LIST_LIMIT or len(people)
+        for connected_person in people[:limit]:
+            await self.xbar_person(connected_person.person, avatar=False)
+
+        if (rest := len(people) - limit) > 0:
+            xbar(f"and {rest} more", sfimage="ellipsis")
+
     async def xbar_person_details(self, person: Person):
         if code := person.attrs.door_code:
             xbar(code, sfimage="lock", copy=True)
@@ -775,6 +1841,15 @@ class WelcomeApp:
         self.xbar_device(conn.device, prefix, suffix, **params)
 
     async def xbar_connection_details(self, conn: Connection):
+        if (fragment := self._connection_details.get(conn)) is not None:
+            xbar_menu.extend(fragment)
+            return
+
+        with xbar_menu.capture() as fragment:
+            await self._xbar_connection_details(conn)
+        self._connection_details[conn] = fragment
+
+    async def _xbar_connection_details(self, conn: Connection):
         xbar_sep()
         xbar("Known" if conn.known else "Unknown", sfimage="person.fill.checkmark" if conn.known else "person.fill.questionmark")
         self.xbar_role(conn.role)
@@ -796,8 +1871,8 @@ class WelcomeApp:
             xbar(metadata.mac, sfimage="externaldrive.badge.questionmark" if metadata.mac_is_private else "externaldrive", copy=True, symbolize=False, emojize=False)
         if metadata.wifi_ssid:
             xbar(metadata.wifi_ssid, sfimage="wifi.circle")
-        if metadata.country:
-            xbar(metadata.country.short_name, sfimage="flag.circle")
+        if country_name := metadata.country_name:
+            xbar(country_name, sfimage="flag.circle")
 
         xbar_sep()
         xbar("More Info", sfimage="info.circle")
@@ -827,69 +1902,570 @@ class WelcomeApp:
     def xbar_error(self, message: str, err: Exception | None = None, **params: Any):
         xbar(message, sfimage="warning", color="red", **params)
         if err:
-            print(err)
+            # Validation errors list every failing field on lines of their own; the first says what failed
+            xbar_menu.append((str(err) or type(err).__name__).splitlines()[0])
+
+    def xbar_degraded(self):
+        if not self.degraded:
+            return
+
+        xbar_sep()
+        xbar(f"Timed out loading: {', '.join(sorted(self.degraded))}", sfimage="exclamationmark.triangle", color="orange")
 
     def xbar_footer(self):
         xbar_sep()
         self.xbar_refresh()
         self.xbar_open()
 
-async def main():
-    app = WelcomeApp()
-
+async def render(app: WelcomeApp):
     try:
-        try:
-            await app.connection
-        except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError) as err:
-            app.xbar_icon()
-            app.xbar_error("Failed to connect to Welcome server", err)
-            app.xbar_footer()
+        # Read the image cache index and failed URLs in worker threads while the API is fetched
+        with span("bootstrap"):
+            await asyncio.gather(app.bootstrap(), cache.load(), failures.load())
+    except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError, TimeoutError, ValidationError) as err:
+        app.xbar_icon()
+        app.xbar_error("Failed to connect to Welcome server", err)
+        app.xbar_footer()
 
-            return
+        return
+
+    prefetch_avatars = asyncio.create_task(app.prefetch_avatars())
+    with span("prefetch_person_connections"):
+        await app.prefetch_person_connections()
+
+    # The fingerprint covers which avatars are cached, so it's only taken once they've all been tried
+    with span("prefetch_avatars"):
+        await prefetch_avatars
 
-        people = await app.connected_people
-        app.xbar_icon(len(people))
+    # Most refreshes find nothing changed, so the previous output can be sent as-is
+    fingerprint = await app.fingerprint()
+    if not app.degraded and (output := await app.read_last_render(fingerprint)) is not None:
+        await app.touch_last_render()
+        xbar_menu.append_rendered(output)
 
+        return
+
+    people = await app.connected_people
+    app.xbar_icon(len(people))
+
+    with span("xbar_welcome"):
         await app.xbar_welcome()
         with xbar_submenu():
             await app.xbar_welcome_details()
 
+            app.xbar_degraded()
             app.xbar_footer()
 
-        home_room_people = await app.home_room_people
-        for home, room_people in home_room_people.items():
+    home_room_layout = await app.home_room_layout
+    for home, rooms in home_room_layout.items():
+        with span("xbar_home", id=home.id):
             xbar_sep()
 
             await app.xbar_home(home, size=15)
             with xbar_submenu():
                 await app.xbar_home_details(home)
 
-            for room, people in room_people.items():
+            for room, room_people in rooms.items():
                 xbar_sep()
 
                 if room:
                     app.xbar_room(room)
 
-                for connected_person in people:
+                for connected_person in room_people.shown:
                     person = connected_person.person
                     conn = connected_person.connection
 
-                    await app.xbar_person(person, avatar_size=26)
+                    with span("xbar_person", id=person.id):
+                        await app.xbar_person(person, avatar_size=PEOPLE_AVATAR_SIZE)
+                        with xbar_submenu():
+                            app.xbar_role(conn.role)
+
+                            await app.xbar_person_details(person)
+
+                            xbar_sep()
+
+                            app.xbar_network(conn.network, label="Connection")
+                            with xbar_submenu():
+                                await app.xbar_connection_details(conn)
+
+                            await app.xbar_person_devices(person)
+
+                for role, people in room_people.unknown.items():
+                    app.xbar_role(role, label=f"{len(people)} Unknown {role.display_name}")
                     with xbar_submenu():
-                        app.xbar_role(conn.role)
+                        await app.xbar_people_list(people)
 
-                        await app.xbar_person_details(person)
+                if room_people.overflow:
+                    xbar(f"{len(room_people.overflow)} more…", sfimage="ellipsis.circle")
+                    with xbar_submenu():
+                        await app.xbar_people_list(room_people.overflow)
 
-                        xbar_sep()
+    if not app.degraded:
+        await app.write_last_render(fingerprint, xbar_menu.render())
 
-                        app.xbar_network(conn.network, label="Connection")
-                        with xbar_submenu():
-                            await app.xbar_connection_details(conn)
+async def wait_for_other_run(run_lock: FileLock) -> str | None:
+    """Take the run lock, or return the menu left by the run that held it. Gives up after `RUN_LOCK_TIMEOUT`."""
+    if run_lock.try_acquire():
+        return None
+
+    started = time.time()
+    acquired = await run_lock.acquire(RUN_LOCK_TIMEOUT)
+
+    try:
+        if acquired and LAST_RENDER_PATH.stat().st_mtime >= started:
+            _, output = LAST_RENDER_PATH.read_text().split("\n", 1)
+            return output
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+async def main():
+    run_lock = FileLock("run")
+    app: WelcomeApp | None = None
+
+    try:
+        with span("run_lock"):
+            output = await wait_for_other_run(run_lock)
+
+        if output is not None:
+            xbar_menu.append_rendered(output)
+        else:
+            # Created under the lock, so cookies saved by the run that held it are picked up
+            app = WelcomeApp()
+
+            with span("render"):
+                await render(app)
+    finally:
+        try:
+            with span("flush"):
+                xbar_menu.flush()
+
+            # SwiftBar shows the menu once stdout closes; /dev/null takes its place so nothing later becomes fd 1
+            try:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                try:
+                    os.dup2(devnull, sys.stdout.fileno())
+                finally:
+                    os.close(devnull)
+            except (OSError, ValueError):
+                # No file descriptor behind stdout, e.g. when redirected in-process
+                pass
+        finally:
+            # TODO: Make app context manager?
+            if app:
+                await app.close()
+            cache.save()
+            failures.save()
+            run_lock.release()
+
+            if tracer:
+                tracer.write()
+            if recorder:
+                recorder.write()
+
+async def stream():
+    """Re-render every `STREAM_INTERVAL` seconds in one process, for a SwiftBar `streamable` plugin."""
+    app = WelcomeApp()
+    run_lock = FileLock("run")
+    previous_output: str | None = None
+
+    try:
+        while True:
+            app.reset()
+
+            # Overlapping one-off runs wait for this refresh and reuse its menu
+            await run_lock.acquire(RUN_LOCK_TIMEOUT)
+            try:
+                with span("render"):
+                    await render(app)
+            except Exception as err:
+                xbar_menu.clear()
+                app.xbar_icon()
+                app.xbar_error("Failed to refresh", err)
+                app.xbar_footer()
+            finally:
+                cache.save()
+                failures.save()
+                app.save_cookies()
+                run_lock.release()
+            if tracer:
+                tracer.write()
+            if recorder:
+                recorder.write()
+
+            output = xbar_menu.render()
+            xbar_menu.clear()
+
+            # Only send a new menu when something changed; `~~~` tells SwiftBar to replace the previous one
+            if output != previous_output:
+                sys.stdout.write("~~~\n" + output)
+                sys.stdout.flush()
+
+                previous_output = output
+
+            await asyncio.sleep(STREAM_INTERVAL)
+    finally:
+        await app.close()
+
+def bench_startup(runs: int = 10) -> bool:
+    """Time importing this script in fresh interpreters, list the slowest imports, and check against `STARTUP_BUDGET_MS`."""
+    import statistics
+    import subprocess
+
+    code = "import importlib.util, sys; spec = importlib.util.spec_from_file_location('welcome', sys.argv[1]); spec.loader.exec_module(importlib.util.module_from_spec(spec))"
+    command = [sys.executable, "-c", code, __file__]
+    env = {**os.environ, "WELCOME_SERVER_URL": SERVER_URL}
+
+    timings: list[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # `-X importtime` slows imports down, so it only gets a separate run for the breakdown
+    result = subprocess.run([sys.executable, "-X", "importtime", *command[1:]], env=env, check=True, capture_output=True, text=True)
+
+    imports: list[tuple[int, str]] = []
+    for line in result.stderr.splitlines():
+        # Format: `import time: <self us> | <cumulative us> | <module>`
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+
+        self_us, _, module = line.removeprefix("import time:").split("|")
+        imports.append((int(self_us), module.strip()))
+
+    median = statistics.median(timings)
+    print(f"Startup: {median:.0f}ms median, {max(timings):.0f}ms max over {runs} runs (budget: {STARTUP_BUDGET_MS}ms)")
+    print("Slowest imports (self time):")
+    for self_us, module in sorted(imports, reverse=True)[:10]:
+        print(f"  {self_us / 1000:7.1f}ms  {module}")
+
+    return median <= STARTUP_BUDGET_MS
+
+class StandInServer(ABC):
+    """Local HTTP server answering every GET with `handle`, for running the plugin without the Welcome server."""
 
-                        await app.xbar_person_devices(person)
+    def __init__(self):
+        self.requests = 0
+        self.base_url = ""
+
+        self._runner: "web.AppRunner | None" = None
+
+    @abstractmethod
+    async def handle(self, request: "web.Request") -> "web.StreamResponse":
+        ...
+
+    async def start(self) -> str:
+        from aiohttp import web
+
+        server = web.Application()
+        server.router.add_get("/{path:.*}", self.handle)
+
+        self._runner = web.AppRunner(server, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+class BenchServer(StandInServer):
+    """Stand-in Welcome server with synthetic homes, people and avatars, used by `--bench`."""
+
+    def __init__(self, homes: int, people: int, latency: float = 0):
+        super().__init__()
+
+        self.homes = homes
+        self.people = people
+        self.latency = latency
+
+    def _home(self, index: int) -> dict[str, Any]:
+        return {
+            "id": f"home-{index}",
+            "display_name": f"Home {index}",
+            "connected": True,
+            "attrs": {
+                "avatar_url": f"{self.base_url}/avatars/home-{index}.png",
+                "address": {"street": f"{index} Main Street", "city": "Amsterdam", "country": "Netherlands"},
+                "wifi": {"ssid": f"Home {index}", "password": "password"},
+                "links": [{"label": "Wiki", "url": "https://example.com", "attrs": {"sf_symbol": "book"}}],
+            },
+        }
+
+    def _person(self, index: int) -> dict[str, Any]:
+        return {
+            "known": index % 4 != 3,
+            "id": f"person-{index}",
+            "display_name": f"Person {index}",
+            "avatar_url": f"{self.base_url}/avatars/person-{index}.png",
+            "attrs": {"phone": "+31 (6) 1234-5678", "email": f"person-{index}@example.com"},
+        }
+
+    def _connection(self, index: int, device: int = 0) -> dict[str, Any]:
+        home = index % self.homes
+        mac = f"02:00:00:{index // 256 % 256:02x}:{index % 256:02x}:{device:02x}"
+        return {
+            "summary": f"Device {device} of person {index}",
+            "known": True,
+            "active_ids": [mac],
+            "known_active_ids": [mac],
+            "network": {"id": f"network-{home}", "display_name": f"Home {home} Wi-Fi", "attrs": {"sf_symbol": "wifi"}},
+            "device": {"known": True, "ids": [mac], "display_name": f"Device {device}", "type": "phone" if device == 0 else "laptop", "tracker": False, "personal": True},
+            "person": self._person(index),
+            "role": {"id": "member" if index % 3 == 0 else "guest", "display_name": "Member" if index % 3 == 0 else "Guest"},
+            "home": self._home(home),
+            "room": {"id": f"room-{home}-{index % 3}", "display_name": f"Room {index % 3}"},
+            "metadata": {"ip": f"10.{home % 256}.{index // 256 % 256}.{index % 256}", "mac": mac, "country": "NL"},
+        }
+
+    def _connected_person(self, index: int) -> dict[str, Any]:
+        connection = self._connection(index)
+        return {key: connection[key] for key in ("person", "home", "room", "role")} | {"known": True, "connection": connection}
+
+    @functools.cache
+    def _avatar(self, name: str) -> bytes:
+        from PIL import Image
+
+        # A different color per avatar, so they don't share a cache entry
+        digest = hashlib.sha256(name.encode()).digest()
+        output = io.BytesIO()
+        Image.new("RGB", (256, 256), (digest[0], digest[1], digest[2])).save(output, format="PNG")
+
+        return output.getvalue()
+
+    def payload(self, path: str) -> Any:
+        if path == "/api/me":
+            return self._connection(0)
+        if path == "/api/homes":
+            return [self._home(index) for index in range(self.homes)]
+        if path == "/api/me/connections":
+            return [self._connection(0), self._connection(0, device=1)]
+        if path == "/api/homes/people":
+            return [self._connected_person(index) for index in range(self.people)]
+        if path.startswith("/api/people/person-") and path.endswith("/connections"):
+            index = int(path.removeprefix("/api/people/person-").removesuffix("/connections"))
+            return [self._connection(index), self._connection(index, device=1)]
+        return None
+
+    async def handle(self, request: "web.Request") -> "web.StreamResponse":
+        from aiohttp import web
+
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if request.path.startswith("/avatars/"):
+            return web.Response(body=self._avatar(request.path), content_type="image/png")
+
+        payload = self.payload(request.path)
+        if payload is None:
+            raise web.HTTPNotFound()
+
+        body = json.dumps(payload).encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+class ReplayServer(StandInServer):
+    """Serves a bundle recorded with `WELCOME_RECORD`, with the recorded statuses, headers and latencies."""
+
+    def __init__(self, directory: Path):
+        super().__init__()
+
+        self.directory = directory
+
+        bundle = json.loads((directory / "bundle.json").read_bytes())
+        self.server_url: str = bundle["server_url"]
+        self.responses: dict[str, dict[str, Any]] = {response["url"]: response for response in bundle["responses"]}
+
+        # Distinct URLs asked for, by whether the bundle has them
+        self.served: set[str] = set()
+        self.missing: set[str] = set()
+
+    async def handle(self, request: "web.Request") -> "web.StreamResponse":
+        from aiohttp import web
+
+        self.requests += 1
+
+        url = request.query.get("url", "")
+        response = self.responses.get(url)
+        if response is None:
+            self.missing.add(url)
+            raise web.HTTPNotFound()
+
+        self.served.add(url)
+
+        await asyncio.sleep(response["latency"])
+
+        # Connection errors and timeouts come back as a server error, after the same wait
+        status = response["status"]
+        if status == 0:
+            raise web.HTTPBadGateway()
+
+        body = (self.directory / "bodies" / response["body"]).read_bytes()
+
+        # Replays start from an empty `WELCOME_DIR`, so a recorded 304 is sent with the body it stood for
+        return web.Response(status=200 if status == 304 else status, body=body, headers=response["headers"])
+
+async def bench_run(server_url: str, welcome_dir: Path, extra_env: dict[str, str] | None = None) -> tuple[float, bytes]:
+    """Run the plugin once in a fresh interpreter, like SwiftBar does. Returns wall time in ms and the output."""
+    env = {key: value for key, value in os.environ.items() if key != "WELCOME_RECORD"}
+    env |= {"WELCOME_SERVER_URL": server_url, "WELCOME_DIR": str(welcome_dir), **(extra_env or {})}
+
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(sys.executable, __file__, env=env, stdout=asyncio.subprocess.PIPE)
+    output, _ = await process.communicate()
+    elapsed = (time.perf_counter() - start) * 1000
+
+    if process.returncode != 0:
+        raise RuntimeError(f"Plugin exited with status {process.returncode}")
+
+    return elapsed, output
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * percent / 100) - 1)]
+
+async def bench(scales: list[tuple[int, int]], runs: int, latency: float) -> None:
+    import tempfile
+
+    print(f"{'homes':>6} {'people':>6} {'cache':>5} {'p50 ms':>8} {'p95 ms':>8} {'requests':>8} {'bytes':>9}")
+
+    for homes, people in scales:
+        server = BenchServer(homes, people, latency)
+        server_url = await server.start()
+
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                warm_dir = Path(temp_dir) / "warm"
+
+                for label in ("cold", "warm"):
+                    timings: list[float] = []
+                    requests = 0
+                    emitted = 0
+
+                    if label == "warm":
+                        # Untimed run to fill the caches
+                        await bench_run(server_url, warm_dir)
+
+                    for run in range(runs):
+                        welcome_dir = warm_dir if label == "warm" else Path(temp_dir) / f"cold-{run}"
+
+                        requests_before = server.requests
+                        elapsed, output = await bench_run(server_url, welcome_dir)
+                        emitted = len(output)
+                        timings.append(elapsed)
+                        requests = server.requests - requests_before
+
+                    print(f"{homes:>6} {people:>6} {label:>5} {percentile(timings, 50):>8.0f} {percentile(timings, 95):>8.0f} {requests:>8} {emitted:>9}")
+        finally:
+            await server.stop()
+
+async def replay(bundle: Path, profile: Path | None = None) -> None:
+    """Run the plugin against a recorded bundle, from an empty `WELCOME_DIR`, optionally under cProfile."""
+    import tempfile
+
+    server = ReplayServer(bundle)
+    replay_url = await server.start()
+
+    extra_env = {"WELCOME_REPLAY": replay_url}
+    if profile:
+        extra_env["WELCOME_PROFILE"] = str(profile)
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            elapsed, output = await bench_run(server.server_url, Path(temp_dir), extra_env)
     finally:
-        # TODO: Make app context manager?
-        await app.session.close()
+        await server.stop()
+
+    sys.stdout.buffer.write(output)
+    print(f"Replayed in {elapsed:.0f} ms: {server.requests} requests for {len(server.served)} of {len(server.responses)} recorded URLs", file=sys.stderr)
+    if server.missing:
+        print(f"{len(server.missing)} requested URLs weren't recorded and got a 404, e.g. {next(iter(server.missing))}", file=sys.stderr)
+
+    if profile:
+        import pstats
+
+        pstats.Stats(str(profile), stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+
+def bench_scale(value: str) -> tuple[int, int]:
+    homes, people = value.split("x")
+    return int(homes), int(people)
+
+def bench_validate(count: int = 1000, runs: int = 20) -> None:
+    """Compare `json.loads` plus per-item `model_validate` against `TypeAdapter.validate_json` on a synthetic connections payload."""
+    import statistics
+
+    server = BenchServer(homes=10, people=count)
+    body = json.dumps([server._connection(index) for index in range(count)]).encode()
+
+    def loads_and_validate() -> list[Connection]:
+        return [Connection.model_validate(raw) for raw in json.loads(body)]
+
+    def validate_json() -> list[Connection]:
+        return CONNECTIONS_ADAPTER.validate_json(body)
+
+    # Both produce the same models, and the first call builds the validators
+    assert loads_and_validate() == validate_json()
+
+    print(f"{count} connections, {len(body) / 1024:.0f} KiB")
+    for label, function in (("json.loads + model_validate", loads_and_validate), ("validate_json", validate_json)):
+        timings: list[float] = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        print(f"{label:>28}: {statistics.median(timings):.1f} ms median")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action="store_true", help="Run as a long-lived SwiftBar streamable plugin")
+    parser.add_argument("--bench-startup", action="store_true", help="Check startup time against STARTUP_BUDGET_MS")
+    parser.add_argument("--bench", action="store_true", help="Time refreshes against a local stand-in server")
+    parser.add_argument("--bench-scale", type=bench_scale, action="append", metavar="HOMESxPEOPLE", help="Fixture size for --bench (repeatable, default: 1x10, 10x100, 100x1000)")
+    parser.add_argument("--bench-runs", type=int, default=5, help="Timed runs per scale for --bench")
+    parser.add_argument("--bench-latency", type=float, default=0, metavar="MS", help="Latency added to each request by the --bench server")
+    parser.add_argument("--bench-validate", action="store_true", help="Time validating a 1000-connection payload from bytes versus parsed JSON")
+    parser.add_argument("--replay", type=Path, metavar="BUNDLE", help="Run against responses recorded with WELCOME_RECORD, served locally")
+    parser.add_argument("--replay-profile", type=Path, metavar="PATH", help="Write a cProfile of the --replay run to PATH and print the top entries")
+    parser.add_argument("--cache-stats", action="store_true", help="Show the size and age of the image cache")
+    parser.add_argument("--cache-prune", action="store_true", help="Remove expired and untracked files from the image cache, and unused lock files")
+    args = parser.parse_args()
+
+    if args.bench_startup:
+        sys.exit(0 if bench_startup() else 1)
+    elif args.bench:
+        asyncio.run(bench(args.bench_scale or [(1, 10), (10, 100), (100, 1000)], args.bench_runs, args.bench_latency / 1000))
+    elif args.bench_validate:
+        bench_validate()
+    elif args.replay:
+        asyncio.run(replay(args.replay, args.replay_profile))
+    elif args.cache_stats:
+        stats = cache.stats()
+        print(f"{stats['entries']} entries, {stats['bytes'] / 1024:.0f} of {stats['max_bytes'] / 1024:.0f} KiB")
+        print(f"{stats['expired']} expired, oldest is {stats['oldest_age'] / 3600:.1f} hours old")
+    elif args.cache_prune:
+        removed_files, removed_bytes = cache.prune()
+        removed_locks = prune_key_locks()
+        print(f"Removed {removed_files} files, {removed_bytes / 1024:.0f} KiB, and {removed_locks} unused lock files")
+    elif args.stream:
+        asyncio.run(stream())
+    elif PROFILE_PATH:
+        import cProfile
+
+        # Only covers the event loop thread, not image transforms or file I/O in `asyncio.to_thread`
+        with cProfile.Profile() as profiler:
+            asyncio.run(main())
+        profiler.dump_stats(PROFILE_PATH)
+    else:
+        asyncio.run(main())